@@ -1,3 +1,5 @@
+import logging
+import os
 import sys
 import time
 from datetime import datetime
@@ -27,7 +29,7 @@ from tenacity import (
 
 from rml.auth import get_env_value, require_auth
 from rml.datatypes import APICommentResponse, AuthResult, AuthStatus
-from rml.git import get_changed_files, get_git_root, raise_if_not_in_git_repo
+from rml.git import GitCatFile, get_changed_files, get_git_root, run_git
 from rml.package_config import (
     CONNECT_TIMEOUT,
     GET_CHECK_ROUTE,
@@ -109,7 +111,6 @@ def get_files_to_zip(
     to_commit: Optional[str],
     **kwargs,
 ) -> dict[str, Any]:
-    raise_if_not_in_git_repo()
     git_root: Path = get_git_root()
     raise_if_files_not_relative_to_git_root(target_filenames, git_root)
 
@@ -119,30 +120,43 @@ def get_files_to_zip(
     from_dir.mkdir(exist_ok=True)
     to_dir.mkdir(exist_ok=True)
 
-    with local.cwd(git_root):
-        tracked_filenames = local["git"]["ls-files"]().splitlines()
-        deleted_filenames = local["git"]["ls-files", "-d"]().splitlines()
-
-        tracked_filenames = list(set(tracked_filenames) - set(deleted_filenames))
+    with GitCatFile(cwd=git_root) as git_cat_file:
+        # Unmerged files are listed once per conflict stage, so deduplicate
+        tracked_filenames = list(
+            dict.fromkeys(
+                os.fsdecode(fname)
+                for fname in run_git("-C", str(git_root), "ls-files", "-z").split(b"\0")
+                if fname
+            )
+        )
         untracked_target_filenames = list(
             set(target_filenames) - set(tracked_filenames)
         )
 
         all_filenames = tracked_filenames + untracked_target_filenames
-        # `git ls-files` can include submodules (which are directories), we filter them out
+        # `git ls-files` can include submodules (which are directories) and files deleted
+        # from the working tree, we filter both out
         all_filenames = list(
             filter(lambda fname: (git_root / fname).is_file(), all_filenames)
         )
+        # `git cat-file --batch` reads one path per line, so paths with newlines can't be requested
+        for filename in all_filenames:
+            if "\n" in filename:
+                logger.debug(f"Skipping file {filename!r} with a newline in its name")
+        all_filenames = [fname for fname in all_filenames if "\n" not in fname]
 
         # Export files at from_commit
         for filename in all_filenames:
             try:
-                file_content = local["git"]["show", f"{from_commit}:{filename}"]()
+                file_content = git_cat_file.read(from_commit, filename)
+                if file_content is None:
+                    logger.debug(f"File {filename} not found in {from_commit=}")
+                    continue
+                # Undecodable bytes are dropped, like `git show` output used to be
+                file_text = file_content.decode(errors="ignore")
                 dst_path = from_dir / filename
                 dst_path.parent.mkdir(parents=True, exist_ok=True)
-                dst_path.write_text(file_content)
-            except ProcessExecutionError:
-                logger.debug(f"File {filename} not found in {from_commit=}")
+                dst_path.write_text(file_text)
             except UnicodeDecodeError:
                 logger.debug(f"File {filename} is not a text file")
 
@@ -158,12 +172,14 @@ def get_files_to_zip(
                     else:
                         logger.debug(f"File {filename} not found in working directory")
                 else:
-                    file_content = local["git"]["show", f"{to_commit}:{filename}"]()
+                    file_content = git_cat_file.read(to_commit, filename)
+                    if file_content is None:
+                        logger.debug(f"File {filename} not found in {to_commit=}")
+                        continue
+                    file_text = file_content.decode(errors="ignore")
                     dst_path = to_dir / filename
                     dst_path.parent.mkdir(parents=True, exist_ok=True)
-                    dst_path.write_text(file_content)
-            except ProcessExecutionError:
-                logger.debug(f"File {filename} not found in {to_commit=}")
+                    dst_path.write_text(file_text)
             except UnicodeDecodeError:
                 logger.debug(f"File {filename} is not a text file")
 
@@ -408,10 +424,15 @@ def main(
     """Find bugs in code. Analyzes changes between two git states for bugs."""
 
     console = Console()
-    handler = RichHandler(
-        console=console,
-        show_time=False,
-    )
+    if console.is_terminal:
+        handler = RichHandler(
+            console=console,
+            show_time=False,
+        )
+    else:
+        # Piped output (e.g. CI or an LLM reading markdown) gets plain log records without Rich's layout
+        handler = logging.StreamHandler(console.file)
+        handler.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
     logger.addHandler(handler)
 
     try:
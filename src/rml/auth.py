@@ -1,10 +1,13 @@
-import asyncio
+import os
+import random
 import sys
+import time
+from contextlib import contextmanager
 from functools import wraps
 from typing import Optional
 
 from dotenv import dotenv_values
-from httpx import AsyncClient, Response
+from httpx import Client, Limits, Response
 from rich.console import Console
 
 from rml.datatypes import (
@@ -20,151 +23,252 @@ from rml.package_config import (
 )
 from rml.ui import display_auth_instructions, render_auth_result
 
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import fcntl
+
+GITHUB_DEVICE_CODE_URL = "https://github.com/login/device/code"
+GITHUB_ACCESS_TOKEN_URL = "https://github.com/login/oauth/access_token"
+GITHUB_USER_URL = "https://api.github.com/user"
+
+# Token polling limits, GitHub's device codes expire after 15 minutes by default
+POLL_DEFAULT_EXPIRES_IN = 900
+POLL_MAX_ATTEMPTS = 120
+POLL_MAX_INTERVAL = 10
+POLL_SAFETY_FACTOR = 1.2
+POLL_SLOW_DOWN_FACTOR = 1.4
+POLL_SLOW_DOWN_INCREMENT = 5
+POLL_JITTER = 0.2
+
+
+def _slow_down_interval(
+    interval: float, slow_down_count: int, min_interval: Optional[int]
+) -> float:
+    # A repeated slow_down means our clock drifts relative to GitHub's,
+    # polling on would only get us rate limited
+    if slow_down_count > 0:
+        raise Exception("Clock drift detected while polling GitHub. Please try again.")
+    # GitHub raises its minimum interval on slow_down and sends the new one along,
+    # without it the interval is increased by the 5 seconds the device flow specifies
+    if min_interval is None:
+        min_interval = interval + POLL_SLOW_DOWN_INCREMENT
+    return max(interval * POLL_SLOW_DOWN_FACTOR, min_interval)
+
+
+def _poll_delay(interval: float, deadline: float) -> float:
+    """
+    Seconds to wait before the next token request.
+    Adds a capped safety margin and jitter on top of the interval requested by GitHub,
+    so that concurrent flows don't poll in lockstep.
+    Raises if the device code expires before the next request could be made.
+    """
+    delay = max(interval, min(interval * POLL_SAFETY_FACTOR, POLL_MAX_INTERVAL))
+    delay *= random.uniform(1, 1 + POLL_JITTER)
+
+    if time.monotonic() + delay > deadline:
+        raise Exception("Device code has expired. Please try again.")
 
-async def get_device_code() -> dict:
+    return delay
+
+
+def get_device_code(client: Client) -> dict:
     """Request device code from GitHub"""
-    async with AsyncClient() as client:
-        response = await client.post(
-            "https://github.com/login/device/code",
-            data={
-                "client_id": OAUTH_APP_CLIENT_ID,
-                "scope": "read:user",
-            },
-            headers={"Accept": "application/json"},
-        )
+    response = client.post(
+        GITHUB_DEVICE_CODE_URL,
+        data={
+            "client_id": OAUTH_APP_CLIENT_ID,
+            "scope": "read:user",
+        },
+        headers={"Accept": "application/json"},
+    )
 
-        if response.status_code != 200:
-            raise Exception(f"Failed to get device code: {response.status_code}")
+    if response.status_code != 200:
+        raise Exception(f"Failed to get device code: {response.status_code}")
 
-        return response.json()
+    return response.json()
 
 
-async def poll_for_token(device_code: str, interval: int = 1) -> str:
+def poll_for_token(
+    client: Client,
+    device_code: str,
+    interval: int = 1,
+    expires_in: int = POLL_DEFAULT_EXPIRES_IN,
+) -> str:
     """Poll GitHub until user completes authentication
 
     Args:
+        client: The client to send the token requests with
         device_code: The device code to use for authentication
         interval: The interval in seconds to poll GitHub
+        expires_in: The number of seconds after which the device code expires
 
     Returns:
-        The access token on success, None on failure
+        The access token on success, raises on failure
     """
-    access_token = None
-
-    async with AsyncClient() as client:
-        while access_token is None:
-            response = await client.post(
-                "https://github.com/login/oauth/access_token",
-                data={
-                    "client_id": OAUTH_APP_CLIENT_ID,
-                    "device_code": device_code,
-                    "grant_type": "urn:ietf:params:oauth:grant-type:device_code",
-                },
-                headers={"Accept": "application/json"},
+    deadline = time.monotonic() + expires_in
+    slow_down_count = 0
+
+    for _ in range(POLL_MAX_ATTEMPTS):
+        response = client.post(
+            GITHUB_ACCESS_TOKEN_URL,
+            data={
+                "client_id": OAUTH_APP_CLIENT_ID,
+                "device_code": device_code,
+                "grant_type": "urn:ietf:params:oauth:grant-type:device_code",
+            },
+            headers={"Accept": "application/json"},
+        )
+
+        if response.status_code != 200:
+            raise Exception(f"Token request failed: {response.status_code}")
+
+        data = response.json()
+
+        if data.get("access_token"):
+            return data["access_token"]
+        elif data.get("error") == "slow_down":
+            interval = _slow_down_interval(
+                interval, slow_down_count, data.get("interval")
             )
+            slow_down_count += 1
+        elif data.get("error") == "expired_token":
+            raise Exception("Device code has expired. Please try again.")
+        elif data.get("error") == "access_denied":
+            raise Exception("User denied authorization request.")
+        elif data.get("error") != "authorization_pending":
+            raise Exception(f"Unexpected error: {data.get('error', 'Unknown error')}")
 
-            if response.status_code != 200:
-                raise Exception(f"Token request failed: {response.status_code}")
-
-            data = response.json()
-
-            if data.get("access_token"):
-                access_token = data["access_token"]
-            elif data.get("error") == "authorization_pending":
-                await asyncio.sleep(interval)
-                continue
-            elif data.get("error") == "slow_down":
-                interval += 3
-                await asyncio.sleep(interval)
-                continue
-            elif data.get("error") == "expired_token":
-                raise Exception("Device code has expired. Please try again.")
-            elif data.get("error") == "access_denied":
-                raise Exception("User denied authorization request.")
-            else:
-                raise Exception(
-                    f"Unexpected error: {data.get('error', 'Unknown error')}"
-                )
+        time.sleep(_poll_delay(interval, deadline))
 
-        return access_token
+    raise Exception("Timed out waiting for authorization. Please try again.")
 
 
-async def send_auth_data_to_backend(access_token: str, user_id: int) -> Response:
+def send_auth_data_to_backend(
+    client: Client, access_token: str, user_id: int
+) -> Response:
     """Send auth data to FastAPI backend"""
-    async with AsyncClient(timeout=10.0) as client:
-        response = await client.post(
-            f"{HOST}/api/auth/verify",
-            headers={"Authorization": f"Bearer {access_token}"},
-            data={"user_id": user_id},
-        )
-        return response
+    return client.post(
+        f"{HOST}/api/auth/verify",
+        headers={"Authorization": f"Bearer {access_token}"},
+        data={"user_id": user_id},
+    )
 
 
-async def get_user_id(access_token: str) -> int:
+def get_user_id(client: Client, access_token: str) -> int:
     """Get user ID from GitHub using access token"""
-    async with AsyncClient(timeout=10.0) as client:
-        response = await client.get(
-            "https://api.github.com/user",
-            headers={
-                "Authorization": f"Bearer {access_token}",
-                "Accept": "application/vnd.github.v3+json",
-            },
-        )
+    response = client.get(
+        GITHUB_USER_URL,
+        headers={
+            "Authorization": f"Bearer {access_token}",
+            "Accept": "application/vnd.github.v3+json",
+        },
+    )
 
-        if response.status_code != 200:
-            raise Exception(f"Failed to get user ID: {response.status_code}")
+    if response.status_code != 200:
+        raise Exception(f"Failed to get user ID: {response.status_code}")
 
-        user_data = response.json()
-        return user_data["id"]
+    user_data = response.json()
+    return user_data["id"]
+
+
+@contextmanager
+def env_file_lock():
+    """
+    Holds an exclusive inter-process lock for read-modify-write of .env.rml.
+    A sidecar lock file is used because .env.rml itself is replaced on every write.
+    """
+    lock_path = ENV_FILE_PATH.with_name(f"{ENV_FILE_PATH.name}.lock")
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with lock_path.open("a+") as lock_file:
+        if sys.platform == "win32":
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        try:
+            yield
+        finally:
+            if sys.platform == "win32":
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
 
 
 def store_env_data(data: dict[str, str]):
     """Store key-value pairs in .env.rml file"""
-    env_data = dotenv_values(ENV_FILE_PATH)
-    env_data = {k: v or "" for k, v in env_data.items()}
-    env_data.update(data)
-    ENV_FILE_PATH.parent.mkdir(parents=True, exist_ok=True)
-    ENV_FILE_PATH.write_text(
-        "\n".join(f"{key}={value}" for key, value in env_data.items())
-    )
+    with env_file_lock():
+        env_data = dotenv_values(ENV_FILE_PATH)
+        env_data = {k: v or "" for k, v in env_data.items()}
+        env_data.update(data)
+
+        # Write to a temporary file first so readers never see a partially written file
+        env_bytes = bytearray()
+        for key, value in env_data.items():
+            if env_bytes:
+                env_bytes += b"\n"
+            env_bytes += key.encode()
+            env_bytes += b"="
+            env_bytes += value.encode()
+
+        tmp_path = ENV_FILE_PATH.with_name(f"{ENV_FILE_PATH.name}.tmp")
+        tmp_path.write_bytes(env_bytes)
+        os.replace(tmp_path, ENV_FILE_PATH)
 
 
 def get_env_value(key: str) -> Optional[str]:
-    """Read a specific value from .env.rml file"""
+    """Read a specific value from the process environment, falling back to .env.rml file"""
+    if value := os.environ.get(key):
+        return value
     env_data = dotenv_values(ENV_FILE_PATH)
     return env_data.get(key)
 
 
 def is_authenticated() -> bool:
-    """Check if user has a stored API key"""
+    """Check if user has an API key in the environment or stored in .env.rml"""
     return get_env_value(RECURSE_API_KEY_NAME) is not None
 
 
-async def authenticate_with_github(console: Console) -> AuthResult:
-    """Main authentication flow with OAuth Device Flow (https://docs.github.com/en/apps/oauth-apps/building-oauth-apps/authorizing-oauth-apps#device-flow)"""
+def authenticate_with_github_sync(console: Console) -> AuthResult:
+    """Main authentication flow with OAuth Device Flow (https://docs.github.com/en/apps/oauth-apps/building-oauth-apps/authorizing-oauth-apps#device-flow)
+
+    The flow is a strictly sequential series of requests, so a single pooled
+    `Client` is used for all of them instead of spinning up an event loop.
+    Idle connections are kept alive for longer than the polling delay, so the
+    connection opened to request the device code is reused by every token poll.
+    """
     try:
-        # Step 1: Get device code
-        device_code = await get_device_code()
-
-        # Step 2: User manually completes auth in browser
-        display_auth_instructions(
-            device_code["verification_uri"],
-            device_code["user_code"],
-            console=console,
-        )
+        with Client(
+            timeout=10.0, limits=Limits(keepalive_expiry=2 * POLL_MAX_INTERVAL)
+        ) as client:
+            # Step 1: Get device code
+            device_code = get_device_code(client)
+
+            # Step 2: User manually completes auth in browser
+            display_auth_instructions(
+                device_code["verification_uri"],
+                device_code["user_code"],
+                console=console,
+            )
 
-        # Step 3: Poll for access token
-        access_token = await poll_for_token(
-            device_code["device_code"],
-            interval=device_code["interval"],
-        )
+            # Step 3: Poll for access token
+            access_token = poll_for_token(
+                client,
+                device_code["device_code"],
+                interval=device_code["interval"],
+                expires_in=device_code.get("expires_in", POLL_DEFAULT_EXPIRES_IN),
+            )
+
+            # Step 4: Get user ID from GitHub
+            user_id = get_user_id(client, access_token)
 
-        # Step 4: Get user ID from GitHub
-        user_id = await get_user_id(access_token)
+            # Step 5: Send to backend
+            console.print("⏳ Syncing with backend ...")
+            backend_response = send_auth_data_to_backend(client, access_token, user_id)
 
-        # Step 5: Send to backend
-        console.print("⏳ Syncing with backend ...")
-        backend_response = await send_auth_data_to_backend(access_token, user_id)
         if backend_response.status_code == 402:
             return AuthResult(status=AuthStatus.PLAN_REQUIRED)
         elif backend_response.status_code != 200:
@@ -195,7 +299,7 @@ def require_auth(f):
         console = Console()
 
         if not (SKIP_AUTH or is_authenticated()):
-            auth_result = asyncio.run(authenticate_with_github(console=console))
+            auth_result = authenticate_with_github_sync(console=console)
             render_auth_result(auth_result, console=console)
             if auth_result.status != AuthStatus.SUCCESS:
                 sys.exit(1)
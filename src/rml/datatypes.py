@@ -1,4 +1,4 @@
-from enum import Enum
+from enum import Enum, IntEnum
 from typing import List, NamedTuple, Optional
 
 from pydantic import BaseModel, field_validator
@@ -30,11 +30,27 @@ class APICommentResponse(BaseModel):
         from_attributes = True
 
 
-class Operator(Enum):
-    ADD = "+"
-    REMOVE = "-"
-    REPLACE = "R"
-    NO_CHANGE = " "
+class Operator(IntEnum):
+    ADD = 1
+    REMOVE = 2
+    REPLACE = 3
+    NO_CHANGE = 4
+
+    @property
+    def symbol(self) -> str:
+        """The character prefixing lines with this operator in a unified diff"""
+        return OPERATOR_SYMBOLS[self]
+
+    def __str__(self):
+        return self.symbol
+
+
+OPERATOR_SYMBOLS = {
+    Operator.ADD: "+",
+    Operator.REMOVE: "-",
+    Operator.REPLACE: "R",
+    Operator.NO_CHANGE: " ",
+}
 
 
 class DiffLine(NamedTuple):
@@ -47,7 +63,7 @@ class DiffLine(NamedTuple):
     def __str__(self):
         old_line_idx = f"{self.old_line_idx}" if self.old_line_idx is not None else "x"
         new_line_idx = f"{self.new_line_idx}" if self.new_line_idx is not None else "x"
-        return f"{old_line_idx}|{new_line_idx} {self.operator.value} {self.content}"
+        return f"{old_line_idx}|{new_line_idx} {self.operator.symbol} {self.content}"
 
 
 class Diff(NamedTuple):
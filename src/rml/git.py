@@ -1,22 +1,112 @@
+import os
+import subprocess
+from functools import lru_cache
+from itertools import chain
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional
 
-from plumbum import local
+# https://git-scm.com/docs/git-status#_short_format
+UNMERGED_STATUSES = (b"DD", b"AU", b"UD", b"UA", b"DU", b"AA", b"UU")
+
+
+def run_git(*args: str) -> bytes:
+    """
+    Run a git command and return its raw stdout.
+
+    Raises:
+        CalledProcessError: If the git command fails
+    """
+    return subprocess.run(["git", *args], capture_output=True, check=True).stdout
+
+
+class GitCatFile:
+    """
+    Reads file contents at given revisions through a single long-lived
+    `git cat-file --batch` process, instead of spawning `git show` per file.
+    """
+
+    def __init__(self, cwd: Optional[Path] = None):
+        self.cwd = cwd
+        self.process: Optional[subprocess.Popen] = None
+
+    def read(self, rev: str, path: str) -> Optional[bytes]:
+        """
+        Get the content of `path` at `rev`.
+
+        Returns:
+            The raw file content, or None if `path` doesn't exist at `rev`
+
+        Raises:
+            ValueError: If `rev` or `path` contains a newline, which would be read as two requests
+        """
+        if "\n" in rev or "\n" in path:
+            raise ValueError(f"Can't read {rev}:{path!r}, it contains a newline")
+
+        if self.process is None:
+            self.process = subprocess.Popen(
+                ["git", "cat-file", "--batch"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                cwd=self.cwd,
+            )
+
+        self.process.stdin.write(f"{rev}:{path}\n".encode())
+        self.process.stdin.flush()
+
+        # Header is either "<oid> <type> <size>" or "<object> missing"/"<object> ambiguous",
+        # where the echoed object name may itself contain spaces
+        header = self.process.stdout.readline().rstrip(b"\n")
+        if header.endswith((b" missing", b" ambiguous")):
+            return None
+
+        _, object_type, size = header.split(b" ")
+        content = self.process.stdout.read(int(size))
+        self.process.stdout.read(1)  # Content is followed by a newline
+
+        if object_type != b"blob":
+            return None
+
+        return content
+
+    def close(self) -> None:
+        if self.process is not None:
+            self.process.stdin.close()
+            self.process.wait()
+            self.process = None
+
+    def __enter__(self) -> "GitCatFile":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
 
 
 def raise_if_not_in_git_repo() -> None:
     """
     Raise ValueError if the current directory is not inside a git repository.
     """
-    git_check_retcode, _, _ = local["git"]["rev-parse", "--is-inside-work-tree"].run(
-        retcode=None
-    )
+    get_git_root()
 
-    if git_check_retcode != 0:
+
+@lru_cache(maxsize=8)
+def get_git_root_for(cwd: str) -> Path:
+    """
+    Get the root directory of the Git repository containing `cwd`.
+    Results are cached, so repeated lookups within a run don't spawn git again.
+
+    Raises:
+        ValueError: If not in a git repository or can't determine root
+    """
+    # A failing `rev-parse --show-toplevel` doubles as the "not a git repository" check
+    try:
+        git_root = run_git("-C", cwd, "rev-parse", "--show-toplevel")
+    except subprocess.CalledProcessError:
         raise ValueError(
             "Not a git repository. Please run this script in a git repository."
         )
 
+    return Path(os.fsdecode(git_root.rstrip(b"\n")))
+
 
 def get_git_root() -> Path:
     """
@@ -28,11 +118,83 @@ def get_git_root() -> Path:
     Raises:
         ValueError: If not in a git repository or can't determine root
     """
-    try:
-        git_root = local["git"]["rev-parse", "--show-toplevel"]()
-        return Path(git_root.strip())
-    except Exception:
-        raise ValueError("Could not determine the Git root directory")
+    return get_git_root_for(os.getcwd())
+
+
+def parse_status_paths(status_output: bytes) -> Iterator[bytes]:
+    """
+    Parse the paths out of `git status --porcelain=v1 -z` output.
+    Unmerged and type-changed entries are skipped, renamed and copied files are reported under their new name.
+    """
+    entries = iter(status_output.split(b"\0"))
+    for entry in entries:
+        if not entry:
+            continue
+
+        # Entries are formatted as "XY <path>", renames and copies are followed by the original path
+        status, path = entry[:2], entry[3:]
+        if status[:1] in (b"R", b"C"):
+            next(entries, None)
+
+        if status in UNMERGED_STATUSES or status.strip() == b"T":
+            continue
+
+        yield path
+
+
+def iter_changed_files(from_ref: str, to_ref: Optional[str] = None) -> Iterator[Path]:
+    """
+    Iterate over the files that have changed between two git references.
+    Paths are yielded in git's output order and may repeat, see `get_changed_files` for a deduplicated list.
+
+    Args:
+        from_ref: The base commit/reference
+        to_ref: The target commit/reference. If None, compares against working directory.
+
+    Yields:
+        Relative file paths that have changed
+
+    Raises:
+        ValueError: If not in a git repository
+        CalledProcessError: If git commands fail
+    """
+    git_root = str(get_git_root())
+
+    # `-z` separates paths with NUL bytes, so paths with special characters are not quoted.
+    # Only added, copied, modified, renamed (reported under their new name) and deleted files are listed.
+    diff_args = ("diff", "-z", "--name-only", "-M", "--diff-filter=ACMRD")
+
+    if to_ref is None and from_ref == "HEAD":
+        # A single `git status` lists both modified and untracked files relative to HEAD
+        all_changed_files = parse_status_paths(
+            run_git(
+                "-C",
+                git_root,
+                "status",
+                "--porcelain=v1",
+                "-z",
+                "--untracked-files=all",
+            )
+        )
+    elif to_ref is None:
+        # Defaults to comparing against working directory - include both modified and untracked files
+        changed_files = run_git("-C", git_root, *diff_args, from_ref)
+        # Get untracked files (newly added files that aren't committed yet)
+        untracked_files = run_git(
+            "-C", git_root, "ls-files", "-z", "--others", "--exclude-standard"
+        )
+        all_changed_files = chain(
+            changed_files.split(b"\0"), untracked_files.split(b"\0")
+        )
+    else:
+        # Compare between two commits
+        all_changed_files = run_git("-C", git_root, *diff_args, from_ref, to_ref).split(
+            b"\0"
+        )
+
+    # With `-z` the only empty entries are the ones after the trailing NUL, whitespace is part of the path
+    for path_name in filter(None, all_changed_files):
+        yield Path(os.fsdecode(path_name))
 
 
 def get_changed_files(from_ref: str, to_ref: Optional[str] = None) -> list[Path]:
@@ -48,25 +210,7 @@ def get_changed_files(from_ref: str, to_ref: Optional[str] = None) -> list[Path]
 
     Raises:
         ValueError: If not in a git repository
-        ProcessExecutionError: If git commands fail
-    """
-    raise_if_not_in_git_repo()
-
-    with local.cwd(get_git_root()):
-        if to_ref is None:
-            # Defaults to comparing against working directory - include both modified and untracked files
-            changed_files = local["git"]["diff", "--name-only", from_ref]().splitlines()
-            # Get untracked files (newly added files that aren't committed yet)
-            untracked_files = local["git"][
-                "ls-files", "--others", "--exclude-standard"
-            ]().splitlines()
-            all_changed_files = changed_files + untracked_files
-        else:
-            # Compare between two commits
-            all_changed_files = local["git"][
-                "diff", "--name-only", from_ref, to_ref
-            ]().splitlines()
-
-        non_empty_path_names = filter(lambda f: f.strip() != "", all_changed_files)
-        changed_file_paths = map(Path, non_empty_path_names)
-        return list(set(changed_file_paths))
+        CalledProcessError: If git commands fail
+    """
+    # Deduplicates while preserving git's output order
+    return list(dict.fromkeys(iter_changed_files(from_ref, to_ref)))
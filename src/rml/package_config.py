@@ -14,8 +14,8 @@ def find_env_file():
         return PROJECT_ROOT / ".env.rml"
 
 
-_current_dir = Path(__file__).parent
-PROJECT_ROOT = (_current_dir / "../../").resolve()
+# `__file__` is already absolute, so walking up src/rml/ doesn't need a `realpath` call
+PROJECT_ROOT = Path(__file__).parent.parent.parent
 INSTALL_URL = "https://install.recurse.ml"
 
 LOG_LEVEL = "DEBUG"
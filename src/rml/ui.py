@@ -1,9 +1,13 @@
-from collections import defaultdict
+import sys
+from bisect import bisect_right
 from enum import Enum
+from functools import lru_cache
+from itertools import accumulate, groupby
 from logging import Logger
-from typing import Any, Callable
+from operator import attrgetter
+from typing import Any, Callable, Iterator, Optional
 
-from rich.console import Console, Group
+from rich.console import Console, Group, RenderableType
 from rich.live import Live
 from rich.markdown import Markdown
 from rich.panel import Panel
@@ -14,13 +18,18 @@ from rich.syntax import Syntax
 from rich.table import Table
 from rich.text import Text
 
-from rml.datatypes import APICommentResponse, AuthResult, AuthStatus
+from rml.datatypes import APICommentResponse, AuthResult, AuthStatus, Diff
 from rml.utils import (
     enrich_bc_ref_locations_with_source,
+    find_hunk_str_containing_line,
     make_diff_header,
-    parse_diff_str_multi_hunk,
+    parse_diff_str_single_hunk,
 )
 
+# Shared by every rendered comment
+COMMENT_PANEL_STYLE = Style(bold=True)
+RULER_STYLE = Style(color="grey50")
+
 
 class StepState(Enum):
     TODO = "TODO"
@@ -35,31 +44,43 @@ class Step:
         self.func = func
         self.state = StepState.TODO
         self.output = {}
+        # Rows only depend on the state, so each one is built once and reused on every
+        # refresh. This also keeps the same `Spinner` (and its start time) while pending.
+        self._renderables: dict[StepState, Table] = {}
 
     def set_state(self, state: StepState):
         self.state = state
 
     def render(self):
+        table = self._renderables.get(self.state)
+        if table is None:
+            table = self._renderables[self.state] = self._build_row(self.state)
+        return table
+
+    def __rich__(self):
+        return self.render()
+
+    def _build_row(self, state: StepState) -> Table:
         table = Table.grid(padding=(0, 1))
         table.add_column(width=4)  # Column for symbol/spinner
         table.add_column(ratio=1)  # Column for label
 
-        if self.state == StepState.TODO:
+        if state == StepState.TODO:
             symbol = Text("[ ]", style="grey50")
             label = Text(self.name, style="grey50")
             table.add_row(symbol, label)
 
-        elif self.state == StepState.PENDING:
+        elif state == StepState.PENDING:
             spinner = Spinner("dots", style="yellow")
             label = Text(self.name, style="yellow")
             table.add_row(spinner, label)
 
-        elif self.state == StepState.DONE:
+        elif state == StepState.DONE:
             symbol = Text("[✔]", style="bold green")
             label = Text(self.name, style="bold green")
             table.add_row(symbol, label)
 
-        elif self.state == StepState.FAIL:
+        elif state == StepState.FAIL:
             symbol = Text("[✘]", style="bold red")
             label = Text(self.name, style="bold red")
             table.add_row(symbol, label)
@@ -91,11 +112,19 @@ class Workflow:
         self.logger = logger
         self.markdown_mode = markdown_mode
 
-    def render(self):
+        # Steps resolve to their current row when rendered, so the panel is built once
+        # and `Live` refresh ticks don't allocate a new one
         table = Table.grid(padding=(0, 1))
         for step in self.steps:
-            table.add_row(step.render())
-        return Panel(table, title="Workflow", border_style="cyan")
+            table.add_row(step)
+        self._panel = Panel(table, title="Workflow", border_style="cyan")
+
+    def render(self):
+        return self._panel
+
+    def __rich__(self):
+        # Lets `Live` re-render the current step states on its own refresh ticks
+        return self.render()
 
     def run(self) -> dict[str, Any]:
         if self.markdown_mode:
@@ -104,11 +133,12 @@ class Workflow:
             return self._run_rich_mode()
 
     def _run_rich_mode(self) -> dict[str, Any]:
-        with Live(self.render(), console=self.console, refresh_per_second=10) as live:
+        # State changes are picked up on the next refresh tick (and when exiting `Live`),
+        # so steps don't need to trigger a re-render themselves
+        with Live(self, console=self.console, refresh_per_second=10):
             prev_output = {}
             for step in self.steps:
                 step.set_state(StepState.PENDING)
-                live.update(self.render())
 
                 try:
                     # Merge previous outputs and global args
@@ -119,12 +149,9 @@ class Workflow:
                     step.set_state(StepState.DONE)
                 except Exception as e:
                     step.set_state(StepState.FAIL)
-                    live.update(self.render())
                     self.logger.error(f"Step '{step.name}' failed")
                     raise e
 
-                live.update(self.render())
-
         self.console.clear()
         self.console.print("[bold green]✅ Analysis finished.[/]")
         return prev_output
@@ -150,7 +177,10 @@ class Workflow:
         return prev_output
 
 
-def make_comment_syntax(lines: list[str]) -> Syntax:
+def make_comment_syntax(lines: list[str], highlight: bool = True) -> Syntax | Text:
+    if not highlight:
+        # Skips lexing the diff when the output can't show colors anyway
+        return Text("".join(lines))
     return Syntax(
         "".join(lines),
         "diff",
@@ -162,6 +192,7 @@ def render_breaking_change(
     comment: APICommentResponse,
     logger: Logger,
     context_window: int = 50,
+    highlight: bool = True,
 ) -> Group:
     """
     Renders a breaking change comment with:
@@ -169,8 +200,7 @@ def render_breaking_change(
     2. The explanation of why it breaks
     3. The affected locations
     """
-    # TODO: should read diff from the response
-    comment_diff = create_comment_diff(comment, logger, context_window)
+    comment_diff = create_comment_diff(comment, logger, context_window, highlight)
 
     comment_md = enrich_bc_ref_locations_with_source(comment)
     if comment_md is None:
@@ -185,7 +215,7 @@ def render_breaking_change(
     return Panel(
         panel_content,
         title=f"{comment.relative_path}:{comment.line_no}",
-        style=Style(bold=True),
+        style=COMMENT_PANEL_STYLE,
     )
 
 
@@ -193,19 +223,19 @@ def render_regular_comment(
     comment: APICommentResponse,
     logger: Logger,
     context_window: int = 50,
+    highlight: bool = True,
 ) -> Group:
     """
     Renders a regular comment with:
     1. The diff showing the context
     2. The comment body
     """
-    # TODO: should read diff from the response
-    comment_diff = create_comment_diff(comment, logger, context_window)
+    comment_diff = create_comment_diff(comment, logger, context_window, highlight)
     panel_content = Group(*comment_diff, Text(comment.body))
     return Panel(
         panel_content,
         title=f"{comment.relative_path}:{comment.line_no}",
-        style=Style(bold=True),
+        style=COMMENT_PANEL_STYLE,
     )
 
 
@@ -214,98 +244,102 @@ def render_comment(
     logger: Logger,
     use_ruler: bool = False,
     context_window: int = 50,
-) -> Group:
+    highlight: bool = True,
+) -> Optional[RenderableType]:
     """
     Args:
         - `comment` the comment to render
         - `logger` the logger to use
         - `use_ruler` draws a horizontal ruler below the comment if set.
         - `context_window` controls how much context of the diff is displayed around each comment on both the sides.
+        - `highlight` syntax highlights the diff if set.
     Returns:
-        A Group of UI elements to be rendered.
+        The UI elements to be rendered, grouped if there is more than one. None if there is nothing to render.
     """
-    ui_elements = []
-
     if comment.reference_locations is not None:
-        comment_panel = render_breaking_change(comment, logger, context_window)
+        comment_panel = render_breaking_change(
+            comment, logger, context_window, highlight
+        )
     else:
-        comment_panel = render_regular_comment(comment, logger, context_window)
+        comment_panel = render_regular_comment(
+            comment, logger, context_window, highlight
+        )
+
+    if not use_ruler:
+        return comment_panel
+
+    ruler = Rule(style=RULER_STYLE)
+    if comment_panel is None:
+        return ruler
+    return Group(comment_panel, ruler)
+
+
+@lru_cache(maxsize=32)
+def _parse_hunk(hunk_str: str) -> tuple[Diff, list[int]]:
+    """
+    Parses a hunk once, comments on the same hunk share the result.
+    Also returns the new version's line number at each change, to locate comments with bisect.
+    """
+    diff = parse_diff_str_single_hunk(hunk_str)
+    change_line_nos = list(
+        accumulate(
+            (change.new_line_idx is not None for change in diff.changes[:-1]),
+            initial=diff.new_start_line_idx + 1,
+        )
+    )
+    return diff, change_line_nos
 
-    if comment_panel is not None:
-        ui_elements.append(comment_panel)
 
-    if use_ruler:
-        ui_elements.append(Rule(style=Style(color="grey50")))
+def _build_context_lines(
+    comment: APICommentResponse, context_window: int
+) -> Optional[list[str]]:
+    """
+    Builds the diff lines shown with a comment: the header of the hunk containing the comment,
+    followed by up to `context_window` changes on either side of the commented line.
+    Returns None if no hunk contains the comment, and an empty list if there's nothing to show.
+    """
+    hunk_str = find_hunk_str_containing_line(comment.diff_str, comment.line_no)
+    if hunk_str is None:
+        return None
+    diff, change_line_nos = _parse_hunk(hunk_str)
 
-    return Group(*ui_elements)
+    # Find the first change past the commented line, only the changes within
+    # `context_window` on either side of it are formatted
+    split_idx = bisect_right(change_line_nos, comment.line_no)
+
+    context_changes = diff.changes[
+        max(0, split_idx - context_window) : split_idx + context_window
+    ]
+    if not context_changes:
+        return []
+
+    full_diff_lines = [make_diff_header(diff)]
+    full_diff_lines.extend(
+        change.operator.symbol + change.content for change in context_changes
+    )
+    return full_diff_lines
 
 
 def create_comment_diff(
     comment: APICommentResponse,
     logger: Logger,
     context_window: int = 50,
+    highlight: bool = True,
 ) -> list[Syntax]:
     """
     Helper function to get the diff to which the comment belongs.
     Returns a list of Syntax elements to be rendered.
     """
     elements = []
-    git_diff = comment.diff_str
-    parsed_output = parse_diff_str_multi_hunk(git_diff)
-
-    diffs_with_comment = []
-
-    for diff in parsed_output:
-        diff_new_start_line_no = diff.new_start_line_idx + 1
-        diff_new_end_line_no = diff_new_start_line_no + diff.new_len
-        if diff_new_start_line_no <= comment.line_no < diff_new_end_line_no:
-            diffs_with_comment.append(diff)
-
-    if len(diffs_with_comment) == 0:
+    full_diff_lines = _build_context_lines(comment, context_window)
+    if full_diff_lines is None:
         logger.warning(
             f"Found a comment {comment.relative_path}:{comment.line_no} with no underlying diff"
         )
         return elements
 
-    if len(diffs_with_comment) > 1:
-        logger.error(
-            "Found multiple diffs containing the same lines, this should not happen"
-        )
-        raise AssertionError(
-            "Found multiple diffs containing the same lines, this should not happen"
-        )
-
-    diff = diffs_with_comment[0]
-    diff_header = make_diff_header(diff)
-    diff_str_lines_before_comment = []
-    diff_str_lines_after_comment = []
-
-    curr_old_line = diff.old_start_line_idx + 1
-    curr_new_line = diff.new_start_line_idx + 1
-
-    for change in diff.changes:
-        if curr_new_line <= comment.line_no:
-            diff_str_lines_before_comment.append(
-                f"{change.operator.value}{change.content}"
-            )
-        else:
-            diff_str_lines_after_comment.append(
-                f"{change.operator.value}{change.content}"
-            )
-
-        if change.old_line_idx is not None:
-            curr_old_line += 1
-        if change.new_line_idx is not None:
-            curr_new_line += 1
-
-    if diff_str_lines_before_comment or diff_str_lines_after_comment:
-        full_diff_lines = [diff_header]
-        if diff_str_lines_before_comment:
-            full_diff_lines.extend(diff_str_lines_before_comment[-context_window:])
-        if diff_str_lines_after_comment:
-            full_diff_lines.extend(diff_str_lines_after_comment[:context_window])
-
-        diff_syntax = make_comment_syntax(lines=full_diff_lines)
+    if full_diff_lines:
+        diff_syntax = make_comment_syntax(lines=full_diff_lines, highlight=highlight)
         diff_panel = Panel(
             diff_syntax,
             border_style="dim",  # dim border for better readability
@@ -316,6 +350,17 @@ def create_comment_diff(
     return elements
 
 
+def _group_comments_by_path(
+    comments: list[APICommentResponse],
+) -> Iterator[tuple[str, list[APICommentResponse]]]:
+    """Groups comments by file path, yielding files in path order and their comments in line order."""
+    sorted_comments = sorted(comments, key=attrgetter("relative_path", "line_no"))
+    for rel_path, file_comments in groupby(
+        sorted_comments, key=attrgetter("relative_path")
+    ):
+        yield rel_path, list(file_comments)
+
+
 def render_comments(
     comments: list[APICommentResponse], console: Console, logger: Logger
 ):
@@ -323,26 +368,33 @@ def render_comments(
     Given a list of comments to be rendered, groups them by the file name, rendering each file in its own panel
     and renders the comments of that file in order along with their diffs.
     """
-    path_comment_map = defaultdict(list)
-
-    for comment in comments:
-        path_comment_map[comment.relative_path].append(comment)
-
-    for rel_path, file_comments in path_comment_map.items():
-        file_comments = sorted(file_comments, key=lambda x: x.line_no)
-        use_rulers = [True] * len(file_comments)
-        use_rulers[-1] = False
-        file_group = Group(
-            *(
-                render_comment(
-                    comment, logger=logger, use_ruler=use_ruler, context_window=3
-                )
-                for comment, use_ruler in zip(file_comments, use_rulers)
+    if not comments:
+        return
+
+    # Highlighting is only visible on a terminal, piped output gets the plain diff
+    highlight = console.is_terminal and not console.no_color
+    file_panels = []
+    for rel_path, file_comments in _group_comments_by_path(comments):
+        last_idx = len(file_comments) - 1
+        rendered_comments = (
+            render_comment(
+                comment,
+                logger=logger,
+                use_ruler=i < last_idx,
+                context_window=3,
+                highlight=highlight,
             )
+            for i, comment in enumerate(file_comments)
+        )
+        file_group = Group(
+            *(rendered for rendered in rendered_comments if rendered is not None)
+        )
+        file_panels.append(
+            Panel(file_group, title=f"[bold white on blue] {rel_path} [/]")
         )
-        file_panel = Panel(file_group, title=f"[bold white on blue] {rel_path} [/]")
 
-        console.print(file_panel)
+    # Rendered and written in one go rather than once per file
+    console.print(Group(*file_panels))
 
 
 def render_auth_result(result: AuthResult, console: Console) -> None:
@@ -381,42 +433,40 @@ def render_comments_markdown(comments: list[APICommentResponse]) -> None:
     Renders comments in markdown format instead of Rich format.
     Groups comments by file and outputs them as markdown.
     """
+    if not comments:
+        return
 
-    path_comment_map = defaultdict(list)
-
-    for comment in comments:
-        path_comment_map[comment.relative_path].append(comment)
-
-    for rel_path, file_comments in path_comment_map.items():
-        file_comments = sorted(file_comments, key=lambda x: x.line_no)
-
-        print(f"\n## {rel_path}\n")
+    for rel_path, file_comments in _group_comments_by_path(comments):
+        # Each file's section is collected and written at once instead of printing every part
+        parts = [f"\n## {rel_path}\n\n"]
 
         for i, comment in enumerate(file_comments):
-            print(f"### Issue {i + 1} (Line {comment.line_no})")
+            parts.append(f"### Issue {i + 1} (Line {comment.line_no})\n")
 
             # Add diff context
             diff_markdown = create_comment_diff_markdown(comment)
             if diff_markdown:
-                print(diff_markdown)
+                parts.append(f"{diff_markdown}\n")
 
             # Add comment body
             if comment.reference_locations is not None:
                 # For breaking changes, use enriched markdown
                 enriched_body = enrich_bc_ref_locations_with_source(comment)
                 if enriched_body is not None:
-                    print(enriched_body)
+                    parts.append(f"{enriched_body}\n")
             else:
                 # For regular comments, just print the body
-                print(comment.body)
+                parts.append(f"{comment.body}\n")
 
             # Add documentation URL if available
             if comment.documentation_url:
-                print(f"\n📚 Documentation: {comment.documentation_url}")
+                parts.append(f"\n📚 Documentation: {comment.documentation_url}\n")
 
             # Add separator between issues (except for the last one)
             if i < len(file_comments) - 1:
-                print("\n---\n")
+                parts.append("\n---\n\n")
+
+        sys.stdout.write("".join(parts))
 
 
 def create_comment_diff_markdown(
@@ -425,54 +475,9 @@ def create_comment_diff_markdown(
     """
     Creates a markdown representation of the diff for a comment.
     """
-    git_diff = comment.diff_str
-    parsed_output = parse_diff_str_multi_hunk(git_diff)
-
-    diffs_with_comment = []
-
-    for diff in parsed_output:
-        diff_new_start_line_no = diff.new_start_line_idx + 1
-        diff_new_end_line_no = diff_new_start_line_no + diff.new_len
-        if diff_new_start_line_no <= comment.line_no < diff_new_end_line_no:
-            diffs_with_comment.append(diff)
-
-    if len(diffs_with_comment) == 0:
-        return ""
-
-    if len(diffs_with_comment) > 1:
+    full_diff_lines = _build_context_lines(comment, context_window)
+    if not full_diff_lines:
         return ""
 
-    diff = diffs_with_comment[0]
-    diff_header = make_diff_header(diff)
-    diff_str_lines_before_comment = []
-    diff_str_lines_after_comment = []
-
-    curr_old_line = diff.old_start_line_idx + 1
-    curr_new_line = diff.new_start_line_idx + 1
-
-    for change in diff.changes:
-        if curr_new_line <= comment.line_no:
-            diff_str_lines_before_comment.append(
-                f"{change.operator.value}{change.content}"
-            )
-        else:
-            diff_str_lines_after_comment.append(
-                f"{change.operator.value}{change.content}"
-            )
-
-        if change.old_line_idx is not None:
-            curr_old_line += 1
-        if change.new_line_idx is not None:
-            curr_new_line += 1
-
-    if diff_str_lines_before_comment or diff_str_lines_after_comment:
-        full_diff_lines = [diff_header]
-        if diff_str_lines_before_comment:
-            full_diff_lines.extend(diff_str_lines_before_comment[-context_window:])
-        if diff_str_lines_after_comment:
-            full_diff_lines.extend(diff_str_lines_after_comment[:context_window])
-
-        diff_content = "".join(full_diff_lines)
-        return f"```diff\n{diff_content}```\n"
-
-    return ""
+    diff_content = "".join(full_diff_lines)
+    return f"```diff\n{diff_content}```\n"
@@ -1,11 +1,13 @@
+import atexit
+import subprocess
 import sys
+from functools import cache
 from importlib.metadata import version
-from os import execv
+from os import execvp
 from pathlib import Path
 
 import click
 from httpx import Client
-from plumbum import FG, local
 
 from rml.package_config import (
     HOST,
@@ -19,9 +21,16 @@ def get_local_version() -> str:
     return version("rml")
 
 
-def get_remote_version() -> str:
+@cache
+def _get_client() -> Client:
+    """Client shared by the version check and the update, so they reuse connections"""
     client = Client(base_url=HOST)
-    response = client.get(VERSION_CHECK_URL, follow_redirects=True)
+    atexit.register(client.close)
+    return client
+
+
+def get_remote_version() -> str:
+    response = _get_client().get(VERSION_CHECK_URL, follow_redirects=True)
     response.raise_for_status()
     return response.text.strip()
 
@@ -31,7 +40,10 @@ def update_and_rerun_rml():
 
     try:
         logger.info(f"Updating rml to version {remote_version}...")
-        (local["curl"][INSTALL_URL] | local["sh"]) & FG
+        # Equivalent to `curl INSTALL_URL | sh`, without spawning curl
+        response = _get_client().get(INSTALL_URL, follow_redirects=True)
+        response.raise_for_status()
+        subprocess.run(["sh"], input=response.content, check=True)
     except Exception as e:
         logger.error(f"Failed to update rml: {e}")
         click.echo("rml requires latest version to run. Please update manually with:")
@@ -44,11 +56,11 @@ def update_and_rerun_rml():
     full_path = sys.argv[0]
     original_args = sys.argv[1:]
 
-    local[full_path][original_args] & FG
     executable_name = Path(full_path).name
 
     logger.info(f"Running updated command: {full_path} {' '.join(original_args)}")
-    # Prepending executable name to original args, as execv's arg0 is expected to be the command name
+    # Prepending executable name to original args, as execvp's arg0 is expected to be the command name
     args = [executable_name] + original_args
     logger.info(f"Running updated command: {' '.join(args)}")
-    execv(full_path, args)
+    # Also resolves `full_path` through PATH if rml was invoked by bare name
+    execvp(full_path, args)
@@ -1,68 +1,118 @@
-import re
+import os
 import time
+from functools import lru_cache, wraps
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional, Sequence
 
 from rml.datatypes import APICommentResponse, Diff, DiffLine, Operator
 
-DIFF_HEADER_PTRN = re.compile(
-    r"@@\s-(?P<old_start>\d+)(?:,(?P<old_len>\d+))?\s+\+(?P<new_start>\d+)(?:,(?P<new_len>\d+))?\s@@"
-)
-DIFF_LINE_PTRN = re.compile(r"(?P<old_no>\d+|x)\|(?P<new_no>\d+|x)")
+# Prefixes of the lines starting a hunk and a file's diff, either one ends the hunk before it
+HUNK_HEADER_PREFIX = "@@"
+FILE_HEADER_PREFIX = "diff --git"
+# File extensions mapped to language identifiers for syntax highlighting
+EXTENSION_LANGUAGES = {
+    ".py": "python",
+    ".js": "javascript",
+    ".ts": "typescript",
+    ".jsx": "jsx",
+    ".tsx": "tsx",
+    ".html": "html",
+    ".css": "css",
+    ".scss": "scss",
+    ".java": "java",
+    ".cpp": "cpp",
+    ".c": "c",
+    ".rs": "rust",
+    ".go": "go",
+    ".rb": "ruby",
+    ".php": "php",
+    ".sh": "bash",
+    ".yaml": "yaml",
+    ".yml": "yaml",
+    ".json": "json",
+    ".md": "markdown",
+    ".sql": "sql",
+    ".kt": "kotlin",
+    ".swift": "swift",
+    ".r": "r",
+    ".scala": "scala",
+    ".pl": "perl",
+    ".lua": "lua",
+    ".ex": "elixir",
+    ".exs": "elixir",
+    ".hs": "haskell",
+    ".fs": "fsharp",
+    ".xml": "xml",
+    ".cs": "csharp",
+}
+
+# Heading of the reference locations section in breaking change comments
+REFERENCE_SECTION_MARKER = "## Affected locations"
 
 
 def parse_diff_str_single_hunk(diff_str: str) -> Diff:
     """Parse a diff string consisting of a single hunk"""
-    diff_str_lines = iter(diff_str.splitlines(keepends=True))
+    return _parse_hunk_lines(diff_str.splitlines(keepends=True))
+
+
+def _parse_hunk_lines(hunk_lines: Sequence[str]) -> Diff:
+    """Parse the lines of a single hunk, including their line endings"""
+    diff_str_lines = iter(hunk_lines)
 
     for line in diff_str_lines:
-        if header_match := DIFF_HEADER_PTRN.match(line):
-            old_start_line_no = int(header_match.group("old_start"))
+        if header := _parse_hunk_header(line):
+            old_start_line_no, old_len, new_start_line_no, new_len = header
             old_start_line_idx = old_start_line_no - 1  # Convert to 0-based indexing
-            new_start_line_no = int(header_match.group("new_start"))
             new_start_line_idx = new_start_line_no - 1
-            # In unified diff format if length is not specified, it is assumed to be 1
-            old_len = int(header_match.group("old_len") or 1)
-            new_len = int(header_match.group("new_len") or 1)
             break
     else:
-        raise ValueError(f"Invalid diff format: {diff_str}")
+        raise ValueError(f"Invalid diff format: {''.join(hunk_lines)}")
 
     diff_lines = []
     curr_old_line_idx = old_start_line_idx
     curr_new_line_idx = new_start_line_idx
+    old_end_line_idx = old_start_line_idx + old_len
+    new_end_line_idx = new_start_line_idx + new_len
     for diff_str_line in diff_str_lines:
-        if (diff_str_line.strip() == "") and (diff_str_line[:1] != " "):
+        # The hunk ends once the lines counted in its header are consumed, anything after it
+        # is the next file's header, e.g. `---`/`+++` lines in diffs without `diff --git` lines
+        if (
+            curr_old_line_idx >= old_end_line_idx
+            and curr_new_line_idx >= new_end_line_idx
+        ):
+            break
+
+        cur_op = diff_str_line[:1]
+        # Skip blank lines, only stripping the ones that don't start with a diff operator
+        if cur_op not in ("+", "-", " ") and not diff_str_line.strip():
             continue
 
         if diff_str_line.startswith(r"\ No newline at end of file"):
             continue
 
-        cur_op, content = diff_str_line[0], diff_str_line[1:]
+        content = diff_str_line[1:]
         assert cur_op in ("+", "-", " "), f"Couldn't parse diff line: '{diff_str_line}'"
 
+        # The operator is already known from the branch, no symbol lookup needed
         if cur_op == "+":
+            operator = Operator.ADD
             new_line_idx = curr_new_line_idx
             curr_new_line_idx += 1
             old_line_idx = None
         elif cur_op == "-":
+            operator = Operator.REMOVE
             old_line_idx = curr_old_line_idx
             curr_old_line_idx += 1
             new_line_idx = None
         elif cur_op == " ":
+            operator = Operator.NO_CHANGE
             old_line_idx = curr_old_line_idx
             new_line_idx = curr_new_line_idx
             curr_old_line_idx += 1
             curr_new_line_idx += 1
 
-        diff_lines.append(
-            DiffLine(
-                operator=Operator(cur_op),
-                old_line_idx=old_line_idx,
-                new_line_idx=new_line_idx,
-                content=content,
-            )
-        )
+        # Positional in DiffLine's field order, this runs once per line of the diff
+        diff_lines.append(DiffLine(operator, content, old_line_idx, new_line_idx))
 
     return Diff(
         old_start_line_idx=old_start_line_idx,
@@ -73,47 +123,98 @@ def parse_diff_str_single_hunk(diff_str: str) -> Diff:
     )
 
 
-def parse_diff_str_multi_hunk(diff_str: str) -> list[Diff]:
-    """Parse a diff string consisting of multiple hunks"""
-    diffs = []
-    current_hunk_lines = []
+def _parse_hunk_header(line: str) -> Optional[tuple[int, int, int, int]]:
+    """
+    Parse a hunk header line like `@@ -1,2 +1,3 @@` without a regex.
 
-    diff_str_lines = iter(diff_str.splitlines(keepends=True))
+    Returns:
+        The old start line number, old length, new start line number and new length.
+        None if the line isn't a hunk header.
+    """
+    if not line.startswith("@@ -"):
+        return None
 
-    # Remove git diff junk
-    clean_diff_str_lines = []
-    for diff_str_line in diff_str_lines:
-        if diff_str_line.startswith("diff --git"):
-            continue
+    new_sep = line.find(" +", 4)
+    header_end = line.find(" @@", new_sep)
+    if new_sep < 0 or header_end < 0:
+        return None
 
-        if diff_str_line.startswith("index "):
-            continue
+    old_start, _, old_len = line[4:new_sep].partition(",")
+    new_start, _, new_len = line[new_sep + 2 : header_end].partition(",")
+    if not all(
+        part.isdecimal()
+        for part in (old_start, old_len or "1", new_start, new_len or "1")
+    ):
+        return None
 
-        if diff_str_line.startswith("---"):
-            continue
+    # In unified diff format if length is not specified, it is assumed to be 1
+    return int(old_start), int(old_len or 1), int(new_start), int(new_len or 1)
 
-        if diff_str_line.startswith("+++"):
-            continue
 
-        clean_diff_str_lines.append(diff_str_line)
+def _find_line_starting_with(diff_str: str, prefix: str, pos: int) -> int:
+    """Offset of the first line at or after the line starting at `pos` that starts with `prefix`"""
+    if diff_str.startswith(prefix, pos):
+        return pos
 
-    diff_str_lines = clean_diff_str_lines
+    idx = diff_str.find(f"\n{prefix}", pos)
+    return idx + 1 if idx >= 0 else len(diff_str)
 
-    for line in diff_str_lines:
-        if DIFF_HEADER_PTRN.match(line):
-            if len(current_hunk_lines) > 0:
-                diffs.append(parse_diff_str_single_hunk("".join(current_hunk_lines)))
-                current_hunk_lines = []
-        elif (len(diffs) == 0) and (len(current_hunk_lines) == 0):
-            # Skip lines before the header of the first hunk
-            continue
-        current_hunk_lines.append(line)
 
-    # Process last hunk
-    if len(current_hunk_lines) > 0:
-        diffs.append(parse_diff_str_single_hunk("".join(current_hunk_lines)))
+def _iter_hunk_spans(
+    diff_str: str,
+) -> Iterator[tuple[int, int, tuple[int, int, int, int]]]:
+    """Yield the start and end offsets of each hunk in a diff, along with its parsed header"""
+    hunk_start = _find_line_starting_with(diff_str, HUNK_HEADER_PREFIX, 0)
+    file_start = _find_line_starting_with(diff_str, FILE_HEADER_PREFIX, 0)
+    while hunk_start < len(diff_str):
+        body_start = diff_str.find("\n", hunk_start) + 1 or len(diff_str)
+        next_hunk_start = _find_line_starting_with(
+            diff_str, HUNK_HEADER_PREFIX, body_start
+        )
+        if file_start < body_start:
+            file_start = _find_line_starting_with(
+                diff_str, FILE_HEADER_PREFIX, body_start
+            )
+
+        if header := _parse_hunk_header(diff_str[hunk_start:body_start]):
+            yield hunk_start, min(next_hunk_start, file_start), header
+
+        hunk_start = next_hunk_start
+
 
-    return diffs
+def iter_diffs(diff_str: str) -> Iterator[Diff]:
+    """Parse the hunks of a diff string one at a time, yielding each as soon as it's parsed"""
+    # Hunks are sliced between their header and the next hunk or file header, so git's file
+    # header lines are never part of a hunk and lines outside of hunks aren't looked at
+    for hunk_start, hunk_end, _ in _iter_hunk_spans(diff_str):
+        yield _parse_hunk_lines(diff_str[hunk_start:hunk_end].splitlines(keepends=True))
+
+
+def parse_diff_str_multi_hunk(diff_str: str) -> list[Diff]:
+    """Parse a diff string consisting of multiple hunks"""
+    return list(iter_diffs(diff_str))
+
+
+def find_hunk_str_containing_line(diff_str: str, line_no: int) -> Optional[str]:
+    """
+    Find the hunk whose new version contains the 1-based `line_no` by matching hunk headers only,
+    so the lines of the other hunks are never parsed.
+
+    Args:
+        diff_str: The diff, possibly consisting of multiple hunks
+        line_no: The line number in the new version of the file
+
+    Returns:
+        The hunk's text starting at its header, to be parsed with `parse_diff_str_single_hunk`.
+        None if no hunk contains the line.
+    """
+    for hunk_start, hunk_end, (_, _, new_start_line_no, new_len) in _iter_hunk_spans(
+        diff_str
+    ):
+        if new_start_line_no <= line_no < new_start_line_no + new_len:
+            return diff_str[hunk_start:hunk_end]
+
+    return None
 
 
 def make_diff_header(diff: Diff) -> str:
@@ -122,7 +223,12 @@ def make_diff_header(diff: Diff) -> str:
 
 
 def wait(secs):
+    if secs <= 0:
+        # Nothing to wait for, leave the function unwrapped
+        return lambda func: func
+
     def decorator(func):
+        @wraps(func)
         def wrapper(*args, **kwargs):
             time.sleep(secs)
             return func(*args, **kwargs)
@@ -132,54 +238,31 @@ def wait(secs):
     return decorator
 
 
-def get_language_from_path(file_path: Path) -> str:
+def get_language_from_path(file_path: str | Path) -> str:
     """
     Maps a file path to its corresponding language identifier for syntax highlighting.
 
     Args:
-        file_path: Path to the file
+        file_path: Path to the file, plain strings don't need to be converted to a `Path`
 
     Returns:
         The language identifier string suitable for syntax highlighting
     """
-    extension_map = {
-        ".py": "python",
-        ".js": "javascript",
-        ".ts": "typescript",
-        ".jsx": "jsx",
-        ".tsx": "tsx",
-        ".html": "html",
-        ".css": "css",
-        ".scss": "scss",
-        ".java": "java",
-        ".cpp": "cpp",
-        ".c": "c",
-        ".rs": "rust",
-        ".go": "go",
-        ".rb": "ruby",
-        ".php": "php",
-        ".sh": "bash",
-        ".yaml": "yaml",
-        ".yml": "yaml",
-        ".json": "json",
-        ".md": "markdown",
-        ".sql": "sql",
-        ".kt": "kotlin",
-        ".swift": "swift",
-        ".r": "r",
-        ".scala": "scala",
-        ".pl": "perl",
-        ".lua": "lua",
-        ".ex": "elixir",
-        ".exs": "elixir",
-        ".hs": "haskell",
-        ".fs": "fsharp",
-        ".xml": "xml",
-        ".cs": "csharp",
-    }
-
-    ext = file_path.suffix
-    return extension_map.get(ext, "text")
+    _, ext = os.path.splitext(file_path)
+    return EXTENSION_LANGUAGES.get(ext, "text")
+
+
+@lru_cache(maxsize=256)
+def _read_source_lines_at(path: str, mtime_ns: int) -> tuple[str, ...]:
+    return tuple(Path(path).read_text().splitlines())
+
+
+def read_source_lines(path: str) -> tuple[str, ...]:
+    """
+    Read the lines of a source file. Files are cached by modification time, so comments referencing
+    the same files don't read them again while picking up changes made in between.
+    """
+    return _read_source_lines_at(path, os.stat(path).st_mtime_ns)
 
 
 def enrich_bc_ref_locations_with_source(comment: APICommentResponse) -> Optional[str]:
@@ -194,35 +277,41 @@ def enrich_bc_ref_locations_with_source(comment: APICommentResponse) -> Optional
         The enriched markdown string with reference locations. Returns None if
         errors occur while reading all of the reference locations.
     """
-    enriched_body = ""
-
-    reference_section_marker = "## Affected locations"
-    bug_desc, _ = comment.body.split(reference_section_marker)
-    enriched_body += bug_desc + reference_section_marker + "\n\n"
+    # Only the description before the first marker is kept, the rest is rebuilt from the reference locations
+    bug_desc, _ = comment.body.split(REFERENCE_SECTION_MARKER, 1)
 
     enriched_reference_locations = []
+    # Reference locations often point into the same file, so each file's lines and language are looked up only once
+    file_sources: dict[str, tuple[tuple[str, ...], str]] = {}
 
     for ref_location in comment.reference_locations:
         try:
-            ref_location_line_src = (
-                Path(ref_location.relative_path)
-                .read_text()
-                .splitlines()[ref_location.line_no - 1]
-            )
+            if ref_location.relative_path not in file_sources:
+                file_sources[ref_location.relative_path] = (
+                    read_source_lines(ref_location.relative_path),
+                    get_language_from_path(ref_location.relative_path),
+                )
+            source_lines, ref_location_language = file_sources[
+                ref_location.relative_path
+            ]
+            ref_location_line_src = source_lines[ref_location.line_no - 1]
         except (FileNotFoundError, PermissionError, IndexError):
             # Reference location is not found, so we skip it
             continue
 
-        ref_location_language = get_language_from_path(Path(ref_location.relative_path))
         enriched_reference_locations.append(
-            f"{ref_location.relative_path}:{ref_location.line_no}"
-            + "\n"
-            + f"```{ref_location_language}\n{ref_location_line_src}\n```\n"
+            f"{ref_location.relative_path}:{ref_location.line_no}\n"
+            f"```{ref_location_language}\n{ref_location_line_src}\n```\n"
         )
 
     if len(enriched_reference_locations) == 0:
         return None
-    else:
-        enriched_body += "\n".join(enriched_reference_locations)
 
-    return enriched_body
+    return "".join(
+        (
+            bug_desc,
+            REFERENCE_SECTION_MARKER,
+            "\n\n",
+            "\n".join(enriched_reference_locations),
+        )
+    )
@@ -0,0 +1,125 @@
+import httpx
+import pytest
+from rich.console import Console
+
+import rml.auth as rml_auth
+from rml.datatypes import AuthStatus
+from rml.package_config import HOST, RECURSE_API_KEY_NAME
+
+
+@pytest.fixture
+def env_file(tmp_path, monkeypatch):
+    """Point .env.rml to a temporary location."""
+    env_file_path = tmp_path / ".env.rml"
+    monkeypatch.setattr("rml.auth.ENV_FILE_PATH", env_file_path)
+    monkeypatch.delenv(RECURSE_API_KEY_NAME, raising=False)
+    return env_file_path
+
+
+def test_is_authenticated_uses_api_key_from_environment(env_file, monkeypatch):
+    """Should not read .env.rml when the API key is set in the environment."""
+    monkeypatch.setenv(RECURSE_API_KEY_NAME, "env-token")
+    monkeypatch.setattr(
+        "rml.auth.dotenv_values",
+        lambda path: pytest.fail(".env.rml should not be read"),
+    )
+
+    assert rml_auth.is_authenticated()
+
+
+def test_is_authenticated_falls_back_to_env_file(env_file):
+    """Should read the API key from .env.rml when it is not in the environment."""
+    assert not rml_auth.is_authenticated()
+
+    env_file.write_text(f"{RECURSE_API_KEY_NAME}=file-token")
+
+    assert rml_auth.is_authenticated()
+    assert rml_auth.get_env_value(RECURSE_API_KEY_NAME) == "file-token"
+
+
+def test_get_env_value_prefers_environment(env_file, monkeypatch):
+    """Should prefer the process environment over .env.rml."""
+    env_file.write_text(f"{RECURSE_API_KEY_NAME}=file-token")
+    monkeypatch.setenv(RECURSE_API_KEY_NAME, "env-token")
+
+    assert rml_auth.get_env_value(RECURSE_API_KEY_NAME) == "env-token"
+
+
+def test_authenticate_with_github_sync_stores_api_key(
+    env_file, respx_mock, monkeypatch
+):
+    """Should poll until the token is issued and store the API key from the backend."""
+    monkeypatch.setattr("time.sleep", lambda x: None)
+    respx_mock.post(rml_auth.GITHUB_DEVICE_CODE_URL).mock(
+        return_value=httpx.Response(
+            200,
+            json={
+                "device_code": "device-code",
+                "user_code": "USER-CODE",
+                "verification_uri": "https://github.com/login/device",
+                "interval": 1,
+            },
+        )
+    )
+    token_route = respx_mock.post(rml_auth.GITHUB_ACCESS_TOKEN_URL)
+    token_route.side_effect = [
+        httpx.Response(200, json={"error": "authorization_pending"}),
+        httpx.Response(200, json={"access_token": "gh-token"}),
+    ]
+    respx_mock.get(rml_auth.GITHUB_USER_URL).mock(
+        return_value=httpx.Response(200, json={"id": 42})
+    )
+    respx_mock.post(f"{HOST}/api/auth/verify").mock(
+        return_value=httpx.Response(200, json={"api_key": "rml-key"})
+    )
+
+    auth_result = rml_auth.authenticate_with_github_sync(Console(quiet=True))
+
+    assert auth_result.status == AuthStatus.SUCCESS
+    assert token_route.call_count == 2
+    assert rml_auth.get_env_value(RECURSE_API_KEY_NAME) == "rml-key"
+
+
+def test_poll_for_token_bails_on_repeated_slow_down(respx_mock, monkeypatch):
+    """Should stop polling when GitHub asks to slow down a second time."""
+    monkeypatch.setattr("time.sleep", lambda x: None)
+    token_route = respx_mock.post(rml_auth.GITHUB_ACCESS_TOKEN_URL)
+    token_route.side_effect = [
+        httpx.Response(200, json={"error": "slow_down"}),
+        httpx.Response(200, json={"error": "slow_down"}),
+        httpx.Response(200, json={"access_token": "gh-token"}),
+    ]
+
+    with httpx.Client() as client:
+        with pytest.raises(Exception, match="Clock drift detected"):
+            rml_auth.poll_for_token(client, "device-code", interval=1)
+
+    assert token_route.call_count == 2
+
+
+def test_poll_for_token_uses_interval_from_slow_down(respx_mock, monkeypatch):
+    """Should wait at least the interval GitHub sends along with slow_down."""
+    delays = []
+    monkeypatch.setattr("time.sleep", delays.append)
+    token_route = respx_mock.post(rml_auth.GITHUB_ACCESS_TOKEN_URL)
+    token_route.side_effect = [
+        httpx.Response(200, json={"error": "slow_down", "interval": 10}),
+        httpx.Response(200, json={"access_token": "gh-token"}),
+    ]
+
+    with httpx.Client() as client:
+        access_token = rml_auth.poll_for_token(client, "device-code", interval=5)
+
+    assert access_token == "gh-token"
+    assert token_route.call_count == 2
+    assert len(delays) == 1 and delays[0] >= 10
+
+
+def test_store_env_data_keeps_existing_keys(env_file):
+    """Should update the given keys without dropping the others."""
+    env_file.write_text("OTHER_KEY=other")
+
+    rml_auth.store_env_data({RECURSE_API_KEY_NAME: "rml-key"})
+
+    assert env_file.read_text() == f"OTHER_KEY=other\n{RECURSE_API_KEY_NAME}=rml-key"
+    assert not env_file.with_name(f"{env_file.name}.tmp").exists()
@@ -1,9 +1,16 @@
+import subprocess
 from pathlib import Path
 
 import pytest
 from plumbum import local
 
-from rml.git import get_changed_files, get_git_root, raise_if_not_in_git_repo
+from rml.git import (
+    GitCatFile,
+    get_changed_files,
+    get_git_root,
+    iter_changed_files,
+    raise_if_not_in_git_repo,
+)
 
 
 @pytest.fixture(scope="function")
@@ -56,15 +63,33 @@ def test_get_git_root(git_repo):
         assert root == git_repo
 
 
+def test_get_git_root_is_cached_per_directory(git_repo, monkeypatch):
+    """Test that the git root is only looked up once per working directory."""
+    import rml.git
+
+    calls = []
+    run_git = rml.git.run_git
+    monkeypatch.setattr(
+        "rml.git.run_git", lambda *args: calls.append(args) or run_git(*args)
+    )
+
+    subdir = git_repo / "subdir"
+    subdir.mkdir()
+
+    with local.cwd(subdir):
+        assert get_git_root() == git_repo
+        assert get_git_root() == git_repo
+
+    assert len(calls) == 1
+
+
 def test_get_git_root_failure(tmp_path):
     """Test that get_git_root raises when not in a git repository."""
     non_git_dir = tmp_path / "not_a_git_repo"
     non_git_dir.mkdir()
 
     with local.cwd(non_git_dir):
-        with pytest.raises(
-            ValueError, match="Could not determine the Git root directory"
-        ):
+        with pytest.raises(ValueError, match="Not a git repository"):
             get_git_root()
 
 
@@ -96,6 +121,37 @@ def test_get_changed_files_working_directory(git_repo):
         assert Path("file3.py") not in changed_files  # unchanged
 
 
+def test_get_changed_files_working_directory_with_staged_and_untracked(git_repo):
+    """Test working directory changes across staged renames, deletions and untracked directories."""
+    with local.cwd(git_repo):
+        local["git"]["mv", "file2.py", "renamed.py"]()
+        (git_repo / "file3.py").unlink()
+        (git_repo / "new_dir").mkdir()
+        (git_repo / "new_dir" / "file5.py").write_text("print('untracked')")
+
+        changed_files = get_changed_files("HEAD")
+
+        assert set(changed_files) == {
+            Path("renamed.py"),
+            Path("file3.py"),
+            Path("new_dir/file5.py"),
+        }
+
+
+def test_get_changed_files_working_directory_against_older_ref(git_repo):
+    """Test comparing the working directory against a ref other than HEAD."""
+    with local.cwd(git_repo):
+        (git_repo / "file4.py").write_text("print('new working file')")
+
+        changed_files = get_changed_files("HEAD~1")
+
+        assert set(changed_files) == {
+            Path("file1.py"),
+            Path("file3.py"),
+            Path("file4.py"),
+        }
+
+
 def test_get_changed_files_no_changes(git_repo):
     """Test getting changed files when there are no changes."""
     with local.cwd(git_repo):
@@ -150,6 +206,30 @@ def test_get_changed_files_multiple_scenarios(git_repo):
         ]  # Deleted files still show up in diff
 
 
+def test_get_changed_files_reports_renames_under_new_name(git_repo):
+    """Test that renamed files are only reported under their new name."""
+    with local.cwd(git_repo):
+        local["git"]["mv", "file2.py", "renamed.py"]()
+        local["git"]["commit", "-m", "Rename file2"]()
+
+        changed_files = get_changed_files("HEAD~1", "HEAD")
+
+        assert changed_files == [Path("renamed.py")]
+
+
+def test_iter_changed_files_can_be_filtered_lazily(git_repo):
+    """Test that changed files can be filtered while iterating."""
+    with local.cwd(git_repo):
+        (git_repo / "notes.txt").write_text("notes")
+        (git_repo / "file2.py").write_text("print('world updated')")
+
+        python_files = [
+            path for path in iter_changed_files("HEAD") if path.suffix == ".py"
+        ]
+
+        assert python_files == [Path("file2.py")]
+
+
 def test_get_changed_files_empty_strings_filtered(git_repo):
     """Test that empty strings are filtered out from git output."""
     with local.cwd(git_repo):
@@ -192,7 +272,7 @@ def test_get_changed_files_invalid_ref(git_repo):
     """Test error handling for invalid git references."""
     with local.cwd(git_repo):
         # This should raise an exception due to invalid git reference
-        with pytest.raises(Exception):  # plumbum.ProcessExecutionError
+        with pytest.raises(subprocess.CalledProcessError):
             get_changed_files("invalid-ref", "HEAD")
 
 
@@ -217,6 +297,38 @@ def test_get_changed_files_duplicates_removed(git_repo):
         assert len(changed_files) == len(set(changed_files))
 
 
+def test_git_cat_file_reads_files_at_revisions(git_repo):
+    """Test reading files at different revisions through a single cat-file process."""
+    with GitCatFile(cwd=git_repo) as git_cat_file:
+        assert git_cat_file.read("HEAD", "file1.py") == b"print('hello updated')"
+        assert git_cat_file.read("HEAD~1", "file1.py") == b"print('hello')"
+        assert git_cat_file.read("HEAD", "file2.py") == b"print('world')"
+
+
+def test_git_cat_file_returns_none_for_missing_files(git_repo):
+    """Test that files missing at a revision are reported as None."""
+    with GitCatFile(cwd=git_repo) as git_cat_file:
+        assert git_cat_file.read("HEAD~1", "file3.py") is None
+        assert git_cat_file.read("invalid-ref", "file1.py") is None
+        # The process keeps working after a miss
+        assert git_cat_file.read("HEAD", "file3.py") == b"print('new file')"
+
+
+def test_git_cat_file_returns_none_for_missing_paths_with_spaces(git_repo):
+    """Test that a missing path containing a space isn't mistaken for an object header."""
+    with GitCatFile(cwd=git_repo) as git_cat_file:
+        assert git_cat_file.read("HEAD", "my file.py") is None
+        assert git_cat_file.read("HEAD", "file1.py") == b"print('hello updated')"
+
+
+def test_git_cat_file_rejects_paths_with_newlines(git_repo):
+    """Test that a path with a newline isn't split into two cat-file requests."""
+    with GitCatFile(cwd=git_repo) as git_cat_file:
+        with pytest.raises(ValueError, match="newline"):
+            git_cat_file.read("HEAD", "a\nb.py")
+        assert git_cat_file.read("HEAD", "file1.py") == b"print('hello updated')"
+
+
 def test_get_changed_files_integration_with_analyze():
     """Integration test to verify get_changed_files works with analyze function."""
     from unittest.mock import Mock, patch
@@ -245,3 +357,96 @@ def test_get_changed_files_integration_with_analyze():
             mock_workflow.assert_called_once()
             args, kwargs = mock_workflow.call_args
             assert kwargs["inputs"]["target_filenames"] == ["file1.py", "file2.py"]
+
+
+def test_get_files_to_zip_exports_both_revisions(git_repo, tmp_path):
+    """Test that get_files_to_zip exports files at from_commit and to_commit."""
+    from rml import get_files_to_zip
+
+    export_dir = tmp_path / "export"
+    export_dir.mkdir()
+
+    with local.cwd(git_repo):
+        result = get_files_to_zip(
+            target_filenames=["file1.py", "file3.py"],
+            tempdir=export_dir,
+            from_commit="HEAD~1",
+            to_commit="HEAD",
+        )
+
+    assert set(result["all_filenames"]) == {"file1.py", "file2.py", "file3.py"}
+    assert (export_dir / "base" / "file1.py").read_text() == "print('hello')"
+    assert not (export_dir / "base" / "file3.py").exists()
+    assert (export_dir / "head" / "file1.py").read_text() == "print('hello updated')"
+    assert (export_dir / "head" / "file3.py").read_text() == "print('new file')"
+
+
+def test_get_files_to_zip_exports_untracked_file_with_space(git_repo, tmp_path):
+    """Test that an untracked file with a space in its name is exported from the working tree."""
+    from rml import get_files_to_zip
+
+    export_dir = tmp_path / "export"
+    export_dir.mkdir()
+
+    with local.cwd(git_repo):
+        (git_repo / "my file.py").write_text("print('untracked')")
+        get_files_to_zip(
+            target_filenames=["my file.py"],
+            tempdir=export_dir,
+            from_commit="HEAD",
+            to_commit=None,
+        )
+
+    assert not (export_dir / "base" / "my file.py").exists()
+    assert (export_dir / "head" / "my file.py").read_text() == "print('untracked')"
+
+
+def test_get_files_to_zip_skips_paths_with_newlines(git_repo, tmp_path):
+    """Test that a tracked path with a newline doesn't shift the contents of other files."""
+    from rml import get_files_to_zip
+
+    export_dir = tmp_path / "export"
+    export_dir.mkdir()
+
+    with local.cwd(git_repo):
+        (git_repo / "a\nb.py").write_text("A\n")
+        (git_repo / "c.py").write_text("C\n")
+        (git_repo / "d.py").write_text("D\n")
+        local["git"]["add", "."]()
+        local["git"]["commit", "-m", "Add a file with a newline in its name"]()
+
+        result = get_files_to_zip(
+            target_filenames=["c.py", "d.py"],
+            tempdir=export_dir,
+            from_commit="HEAD",
+            to_commit="HEAD",
+        )
+
+    assert "a\nb.py" not in result["all_filenames"]
+    assert (export_dir / "head" / "c.py").read_text() == "C\n"
+    assert (export_dir / "head" / "d.py").read_text() == "D\n"
+
+
+def test_get_files_to_zip_exports_non_utf8_files(git_repo, tmp_path):
+    """Test that files which aren't valid UTF-8 are exported with undecodable bytes dropped."""
+    from rml import get_files_to_zip
+
+    export_dir = tmp_path / "export"
+    export_dir.mkdir()
+
+    with local.cwd(git_repo):
+        (git_repo / "latin.py").write_bytes("name = 'café'\n".encode("latin-1"))
+        local["git"]["add", "latin.py"]()
+        local["git"]["commit", "-m", "Add a Latin-1 file"]()
+        (git_repo / "latin.py").write_bytes("name = 'naïve'\n".encode("latin-1"))
+        local["git"]["commit", "-am", "Update the Latin-1 file"]()
+
+        get_files_to_zip(
+            target_filenames=["latin.py"],
+            tempdir=export_dir,
+            from_commit="HEAD~1",
+            to_commit="HEAD",
+        )
+
+    assert (export_dir / "base" / "latin.py").read_text() == "name = 'caf'\n"
+    assert (export_dir / "head" / "latin.py").read_text() == "name = 'nave'\n"
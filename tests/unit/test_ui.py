@@ -0,0 +1,206 @@
+from io import StringIO
+from logging import getLogger
+from textwrap import dedent
+
+import pytest
+from rich.console import Console
+
+import rml.ui
+from rml.datatypes import APICommentResponse
+from rml.ui import (
+    Step,
+    StepState,
+    Workflow,
+    create_comment_diff_markdown,
+    render_comments_markdown,
+)
+
+
+@pytest.fixture
+def console():
+    return Console(file=StringIO(), force_terminal=True)
+
+
+def make_workflow(console, steps, markdown_mode=False):
+    return Workflow(
+        steps=steps,
+        console=console,
+        logger=getLogger("test"),
+        markdown_mode=markdown_mode,
+        inputs=dict(global_arg=1),
+    )
+
+
+@pytest.mark.parametrize("markdown_mode", [False, True])
+def test_workflow_passes_outputs_to_next_step(console, markdown_mode):
+    steps = [
+        Step(name="First", func=lambda global_arg, **kwargs: dict(x=global_arg + 1)),
+        Step(name="Second", func=lambda x, global_arg, **kwargs: dict(y=x * 10)),
+    ]
+
+    output = make_workflow(console, steps, markdown_mode).run()
+
+    assert output == dict(y=20)
+
+
+def test_workflow_renders_final_step_states(console):
+    steps = [Step(name="Only step", func=lambda **kwargs: dict())]
+
+    make_workflow(console, steps).run()
+
+    assert steps[0].state == StepState.DONE
+    assert "[✔]" in console.file.getvalue()
+
+
+def test_workflow_marks_failed_step_and_reraises(console):
+    def fail(**kwargs):
+        raise ValueError("step failed")
+
+    steps = [
+        Step(name="First", func=lambda **kwargs: dict(x=1)),
+        Step(name="Second", func=fail),
+        Step(name="Third", func=lambda **kwargs: dict()),
+    ]
+
+    with pytest.raises(ValueError, match="step failed"):
+        make_workflow(console, steps).run()
+
+    assert [step.state for step in steps] == [
+        StepState.DONE,
+        StepState.FAIL,
+        StepState.TODO,
+    ]
+
+
+def test_step_reuses_row_per_state():
+    step = Step(name="Step", func=lambda **kwargs: dict())
+
+    todo = step.render()
+    assert step.render() is todo
+
+    step.set_state(StepState.PENDING)
+    pending = step.render()
+    assert pending is not todo
+    assert step.render() is pending
+
+    step.set_state(StepState.TODO)
+    assert step.render() is todo
+
+
+def test_comments_sharing_a_hunk_parse_it_once(monkeypatch, capsys):
+    diff_str = dedent("""\
+    @@ -1,2 +1,3 @@
+     a
+    +b
+     c
+    """)
+    comments = [
+        APICommentResponse(
+            body=f"comment {line_no}",
+            diff_str=diff_str,
+            relative_path="file.py",
+            line_no=line_no,
+        )
+        for line_no in (1, 2, 3)
+    ]
+    parsed_diffs = []
+    parse = rml.ui.parse_diff_str_single_hunk
+    monkeypatch.setattr(
+        rml.ui,
+        "parse_diff_str_single_hunk",
+        lambda diff_str: parsed_diffs.append(diff_str) or parse(diff_str),
+    )
+    rml.ui._parse_hunk.cache_clear()
+
+    render_comments_markdown(comments)
+
+    assert parsed_diffs == [diff_str]
+    assert capsys.readouterr().out.count("```diff") == 3
+
+
+def test_comment_diff_markdown_keeps_context_window_around_comment():
+    diff_str = dedent("""\
+    @@ -1,5 +1,6 @@
+     a
+     b
+    -c
+    +C
+    +D
+     e
+     f
+    """)
+    comment = APICommentResponse(
+        body="comment", diff_str=diff_str, relative_path="file.py", line_no=4
+    )
+
+    diff_markdown = create_comment_diff_markdown(comment, context_window=2)
+
+    assert diff_markdown.splitlines()[2:] == ["+C", "+D", " e", " f", "```"]
+
+
+def test_workflow_panel_shows_current_step_states(console):
+    steps = [Step(name="Step", func=lambda **kwargs: dict())]
+    workflow = make_workflow(console, steps)
+
+    panel = workflow.render()
+    steps[0].set_state(StepState.FAIL)
+    console.print(panel)
+
+    assert workflow.render() is panel
+    assert "[✘]" in console.file.getvalue()
+
+
+def test_render_comments_markdown_groups_by_path_and_line(capsys):
+    comments = [
+        APICommentResponse(
+            body=f"{path}:{line_no}", diff_str="", relative_path=path, line_no=line_no
+        )
+        for path, line_no in [("b.py", 7), ("a.py", 3), ("b.py", 2), ("a.py", 1)]
+    ]
+
+    render_comments_markdown(comments)
+
+    output = capsys.readouterr().out
+    headings = [line for line in output.splitlines() if line.startswith("#")]
+    assert headings == [
+        "## a.py",
+        "### Issue 1 (Line 1)",
+        "### Issue 2 (Line 3)",
+        "## b.py",
+        "### Issue 1 (Line 2)",
+        "### Issue 2 (Line 7)",
+    ]
+
+
+def test_render_comments_skips_highlighting_when_not_a_terminal(monkeypatch):
+    diff_str = dedent("""\
+    @@ -1,2 +1,2 @@
+    -a
+    +b
+     c
+    """)
+    comment = APICommentResponse(
+        body="comment", diff_str=diff_str, relative_path="file.py", line_no=1
+    )
+    console = Console(file=StringIO(), force_terminal=False)
+    monkeypatch.setattr(
+        rml.ui, "Syntax", lambda *args, **kwargs: pytest.fail("diff was highlighted")
+    )
+
+    rml.ui.render_comments([comment], console=console, logger=getLogger("test"))
+
+    assert "+b" in console.file.getvalue()
+
+
+@pytest.mark.parametrize("markdown_mode", [False, True])
+def test_workflow_inputs_take_precedence_over_step_outputs(console, markdown_mode):
+    steps = [
+        Step(name="First", func=lambda **kwargs: dict(global_arg=100, x=1)),
+        Step(
+            name="Second", func=lambda global_arg, x, **kwargs: dict(y=global_arg + x)
+        ),
+    ]
+
+    output = make_workflow(console, steps, markdown_mode).run()
+
+    assert output == dict(y=2)
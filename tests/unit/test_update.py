@@ -0,0 +1,46 @@
+import httpx
+import pytest
+
+import rml.update as rml_update
+from rml.package_config import INSTALL_URL
+
+
+@pytest.fixture
+def update_calls(monkeypatch):
+    """Records the installer and re-exec calls instead of running them."""
+    calls = []
+    monkeypatch.setattr(rml_update, "get_remote_version", lambda: "2.0.0")
+    monkeypatch.setattr(
+        rml_update.subprocess,
+        "run",
+        lambda args, input, check: calls.append(("run", args, input)),
+    )
+    monkeypatch.setattr(
+        rml_update, "execvp", lambda path, args: calls.append(("execvp", path, args))
+    )
+    monkeypatch.setattr(
+        rml_update.sys, "argv", ["/usr/local/bin/rml", "--from", "HEAD~1"]
+    )
+    return calls
+
+
+def test_update_and_rerun_rml_pipes_install_script_to_sh(respx_mock, update_calls):
+    respx_mock.get(INSTALL_URL).mock(
+        return_value=httpx.Response(200, content=b"echo install")
+    )
+
+    rml_update.update_and_rerun_rml()
+
+    assert update_calls == [
+        ("run", ["sh"], b"echo install"),
+        ("execvp", "/usr/local/bin/rml", ["rml", "--from", "HEAD~1"]),
+    ]
+
+
+def test_update_and_rerun_rml_exits_when_download_fails(respx_mock, update_calls):
+    respx_mock.get(INSTALL_URL).mock(return_value=httpx.Response(500))
+
+    with pytest.raises(SystemExit):
+        rml_update.update_and_rerun_rml()
+
+    assert update_calls == []
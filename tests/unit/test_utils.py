@@ -1,9 +1,20 @@
+import os
+from pathlib import Path
 from textwrap import dedent
 
 import pytest
 
 from rml.datatypes import APICommentResponse, SourceLocation
-from rml.utils import enrich_bc_ref_locations_with_source
+from rml.utils import (
+    enrich_bc_ref_locations_with_source,
+    find_hunk_str_containing_line,
+    get_language_from_path,
+    iter_diffs,
+    parse_diff_str_multi_hunk,
+    parse_diff_str_single_hunk,
+    read_source_lines,
+    wait,
+)
 
 
 @pytest.fixture(scope="function")
@@ -144,3 +155,218 @@ def test_enrich_bc_ref_locations_with_source_keeps_only_reference_locations_that
     )
 
     assert enriched_body == expected
+
+
+def test_enrich_bc_ref_locations_with_source_reads_each_file_once(
+    filepath_1, tmp_path, monkeypatch
+):
+    filepath_multi = tmp_path / "test_multi.py"
+    filepath_multi.write_text("def a(): pass\ndef b(): pass\n")
+    comment = APICommentResponse(
+        body="Breaking change\n## Affected locations\n",
+        diff_str="",
+        relative_path=str(filepath_1),
+        line_no=1,
+        reference_locations=[
+            SourceLocation(relative_path=str(filepath_multi), line_no=1),
+            SourceLocation(relative_path=str(filepath_multi), line_no=2),
+        ],
+    )
+
+    read_paths = []
+    read_text = Path.read_text
+    monkeypatch.setattr(
+        Path, "read_text", lambda self: read_paths.append(self) or read_text(self)
+    )
+
+    enriched_body = enrich_bc_ref_locations_with_source(comment)
+    # Another comment referencing the same unchanged file doesn't read it again
+    assert enrich_bc_ref_locations_with_source(comment) == enriched_body
+
+    assert read_paths == [filepath_multi]
+    assert "```python\ndef a(): pass\n```" in enriched_body
+    assert "```python\ndef b(): pass\n```" in enriched_body
+
+
+def test_parse_diff_str_multi_hunk_returns_no_hunks_for_diff_without_hunks():
+    diff_str = dedent("""\
+    diff --git a/image.png b/image.png
+    index 1234567..89abcde 100644
+    Binary files a/image.png and b/image.png differ
+    """)
+
+    assert parse_diff_str_multi_hunk(diff_str) == []
+    assert parse_diff_str_multi_hunk("") == []
+
+
+def test_find_hunk_str_containing_line_returns_only_that_hunk():
+    hunks = [
+        "@@ -2,2 +2,3 @@\n a\n+b\n c\n",
+        "@@ -10,2 +11,0 @@\n-d\n-e\n",
+        "@@ -20,2 +20,2 @@ def f():\n-f\n+g\n h\n",
+    ]
+    diff_str = (
+        "diff --git a/file.py b/file.py\n--- a/file.py\n+++ b/file.py\n"
+        + "".join(hunks)
+        + "diff --git a/other.py b/other.py\n"
+    )
+
+    assert find_hunk_str_containing_line(diff_str, 1) is None
+    assert find_hunk_str_containing_line(diff_str, 3) == hunks[0]
+    assert find_hunk_str_containing_line(diff_str, 11) is None
+    assert find_hunk_str_containing_line(diff_str, 21) == hunks[2]
+    assert find_hunk_str_containing_line(diff_str, 22) is None
+    assert (
+        parse_diff_str_single_hunk(hunks[2]) == parse_diff_str_multi_hunk(diff_str)[2]
+    )
+
+
+@pytest.mark.parametrize(
+    "header, start_and_len",
+    [
+        ("@@ -3 +4 @@\n", (2, 1, 3, 1)),
+        ("@@ -0,0 +1,2 @@ def f():\n", (-1, 0, 0, 2)),
+        ("@@ -10,3 +12 @@\n", (9, 3, 11, 1)),
+    ],
+)
+def test_parse_diff_str_single_hunk_header(header, start_and_len):
+    diff = parse_diff_str_single_hunk(header)
+
+    assert (
+        diff.old_start_line_idx,
+        diff.old_len,
+        diff.new_start_line_idx,
+        diff.new_len,
+    ) == start_and_len
+
+
+@pytest.mark.parametrize("header", ["@@ -a +1 @@\n", "@@ -1 +1\n", "@@ -,2 +1 @@\n"])
+def test_parse_diff_str_single_hunk_rejects_invalid_header(header):
+    with pytest.raises(ValueError):
+        parse_diff_str_single_hunk(header)
+
+
+def test_parse_diff_str_multi_hunk_stops_hunks_at_next_file_header():
+    diff_str = dedent("""\
+    --- a/first.py
+    +++ b/first.py
+    @@ -1,2 +1,2 @@
+     a
+    -b
+    +c
+    --- a/second.py
+    +++ b/second.py
+    @@ -4 +4 @@
+    -d
+    +e
+    """)
+
+    first, second = parse_diff_str_multi_hunk(diff_str)
+
+    assert "".join(line.operator.symbol + line.content for line in first.changes) == (
+        " a\n-b\n+c\n"
+    )
+    assert "".join(line.operator.symbol + line.content for line in second.changes) == (
+        "-d\n+e\n"
+    )
+
+
+def test_iter_diffs_yields_hunks_lazily():
+    diff_str = "@@ -1 +1 @@\n-a\n+b\n@@ -5 +5 @@\n-c\n+d\n"
+    diffs = iter_diffs(diff_str)
+
+    assert next(diffs) == parse_diff_str_single_hunk("@@ -1 +1 @@\n-a\n+b\n")
+    assert list(diffs) == parse_diff_str_multi_hunk(diff_str)[1:]
+
+
+def test_read_source_lines_rereads_modified_files(tmp_path):
+    filepath = tmp_path / "test_modified.py"
+    filepath.write_text("def a(): pass\n")
+    assert read_source_lines(str(filepath)) == ("def a(): pass",)
+
+    filepath.write_text("def b(): pass\n")
+    os.utime(filepath, ns=(0, 0))
+
+    assert read_source_lines(str(filepath)) == ("def b(): pass",)
+
+
+def test_enrich_bc_ref_locations_with_source_splits_on_first_marker(
+    filepath_1, filepath_2
+):
+    comment = APICommentResponse(
+        body="Breaking change\n## Affected locations\nfoo\n## Affected locations\n",
+        diff_str="",
+        relative_path=str(filepath_1),
+        line_no=1,
+        reference_locations=[
+            SourceLocation(relative_path=str(filepath_2), line_no=1),
+        ],
+    )
+
+    enriched_body = enrich_bc_ref_locations_with_source(comment)
+
+    assert enriched_body == (
+        f"Breaking change\n## Affected locations\n\n{filepath_2}:1\n"
+        "```python\ndef test_2(): pass\n```\n"
+    )
+
+
+@pytest.mark.parametrize(
+    "file_path, language",
+    [
+        ("src/main.py", "python"),
+        (Path("src/main.py"), "python"),
+        ("lib/mix.exs", "elixir"),
+        ("Makefile", "text"),
+        (".bashrc", "text"),
+        ("archive.", "text"),
+    ],
+)
+def test_get_language_from_path(file_path, language):
+    assert get_language_from_path(file_path) == language
+
+
+def test_parse_diff_str_multi_hunk_slices_hunks_between_file_headers():
+    diff_str = dedent("""\
+    diff --git a/query.sql b/query.sql
+    index 1234567..89abcde 100644
+    --- a/query.sql
+    +++ b/query.sql
+    @@ -1,2 +1,2 @@
+    --- old comment
+    +-- new comment
+     SELECT 1;
+    diff --git a/new.py b/new.py
+    new file mode 100644
+    index 0000000..1234567
+    --- /dev/null
+    +++ b/new.py
+    @@ -0,0 +1 @@
+    +print("new")
+    """)
+
+    diffs = parse_diff_str_multi_hunk(diff_str)
+
+    assert [change.operator.symbol + change.content for change in diffs[0].changes] == [
+        "--- old comment\n",
+        "+-- new comment\n",
+        " SELECT 1;\n",
+    ]
+    assert [change.operator.symbol + change.content for change in diffs[1].changes] == [
+        '+print("new")\n'
+    ]
+
+
+def test_wait_sleeps_before_calling(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr("time.sleep", sleeps.append)
+
+    def add(a, b):
+        return a + b
+
+    wrapped_add = wait(0.5)(add)
+
+    assert wrapped_add(1, 2) == 3
+    assert sleeps == [0.5]
+    assert wrapped_add.__name__ == "add"
+    assert wait(0)(add) is add